@@ -4,17 +4,33 @@
 
 import os
 import re
-import ast
+import hashlib
+import functools
+import threading
+import time
 from decimal import Decimal
 from typing import Any, Dict, List, Tuple, Union, Optional
 
+import streamlit as st
+from cachetools import TTLCache, cached
 from dotenv import load_dotenv
-from langchain_community.utilities import SQLDatabase
+try:
+    import ahocorasick
+except ImportError:  # optional: normalize_retail falls back to the regex chain
+    ahocorasick = None
+try:
+    import hyperscan
+except ImportError:  # optional: the non-SELECT check falls back to `re`
+    hyperscan = None
+import numpy as np
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 
 from gemini_llm import GeminiLLM
 from few_shots_retail import FEW_SHOTS
+from semantic_cache import embed, get_semantic_cache
+from numba_parsers import first_number
 
 # ---------- Env & DB ----------
 load_dotenv()
@@ -25,11 +41,92 @@ if not DB_URL:
 if not GOOGLE_API_KEY:
     raise RuntimeError("GOOGLE_API_KEY is not set")
 
-db = SQLDatabase.from_uri(DB_URL, sample_rows_in_table_info=3)
-llm = GeminiLLM()
+@st.cache_resource
+def get_sql_engine() -> Engine:
+    """One pooled SQLAlchemy engine per server process (survives Streamlit reruns).
 
-# ---------- Few-shots block ----------
-EXAMPLES = "\n\n".join([f"Q: {e['q']}\nSQL: {e['sql']}" for e in FEW_SHOTS])
+    Connections are reused across turns (no TCP + auth handshake per question);
+    recycled after 30 min so MySQL's wait_timeout never hands us a dead socket.
+    """
+    return create_engine(DB_URL, pool_size=8, pool_recycle=1800, pool_pre_ping=True)
+
+@st.cache_resource
+def get_llm() -> GeminiLLM:
+    """One Gemini client per server process."""
+    return GeminiLLM()
+
+_TYPE_NOISE_RE = re.compile(r"\s+(?:CHARACTER SET|COLLATE)\s+\S+", re.I)
+
+# Column layout only: UPDATE_TIME in information_schema.tables also moves on plain DML.
+_SCHEMA_FINGERPRINT_SQL = (
+    "SELECT table_name, column_name, column_type FROM information_schema.columns "
+    "WHERE table_schema = DATABASE() ORDER BY table_name, ordinal_position"
+)
+SCHEMA_POLL_SECONDS = 300
+
+def _schema_fingerprint() -> str:
+    with get_sql_engine().connect() as conn:
+        rows = conn.execute(text(_SCHEMA_FINGERPRINT_SQL)).all()
+    return hashlib.md5(repr([tuple(r) for r in rows]).encode("utf-8")).hexdigest()
+
+@st.cache_resource
+def _start_schema_watcher() -> threading.Thread:
+    """Daemon thread that drops the cached schema as soon as DDL changes the column layout."""
+    def watch() -> None:
+        last = None
+        while True:
+            try:
+                fp = _schema_fingerprint()
+            except Exception:
+                fp = last   # DB hiccup: keep the cached schema, retry next tick
+            if last is not None and fp != last:
+                get_schema.clear()
+            last = fp
+            time.sleep(SCHEMA_POLL_SECONDS)
+
+    t = threading.Thread(target=watch, name="schema-watcher", daemon=True)
+    t.start()
+    return t
+
+@st.cache_data(ttl=3600)
+def get_schema() -> str:
+    """Minified schema for the prompt, e.g. `t_shirts(t_shirt_id INTEGER, brand ENUM(...), ...)`.
+
+    Reflected from the live DB but without the CREATE TABLE boilerplate and
+    sample rows. Cached for an hour; the schema watcher clears it early on DDL.
+    """
+    _start_schema_watcher()
+    engine = get_sql_engine()
+    tables = []
+    # All reflection queries share one pooled connection instead of checking one out per call.
+    with engine.connect() as conn:
+        insp = inspect(conn)
+        for table in insp.get_table_names():
+            cols = [
+                f"{c['name']} {_TYPE_NOISE_RE.sub('', c['type'].compile(dialect=engine.dialect))}"
+                for c in insp.get_columns(table)
+            ]
+            for fk in insp.get_foreign_keys(table):
+                for col, ref in zip(fk["constrained_columns"], fk["referred_columns"]):
+                    cols.append(f"FK {col}→{fk['referred_table']}.{ref}")
+            tables.append(f"{table}({', '.join(cols)})")
+    return "\n".join(tables)
+
+# ---------- Few-shots (top-k most similar to the question) ----------
+FEW_SHOT_K = 3
+# Rendered with the ";" the prompt asks for: the model copies the examples, and the streaming
+# early stop only fires on a line ending in ";" (_clean_sql strips it again).
+EXAMPLE_BLOCKS = [f"Q: {e['q']}\nSQL: {e['sql']};" for e in FEW_SHOTS]
+
+@st.cache_resource
+def _few_shot_vecs() -> np.ndarray:
+    """Embeddings of the few-shot questions, computed once per server process."""
+    return embed([e["q"] for e in FEW_SHOTS])
+
+def select_examples(vec: np.ndarray, k: int = FEW_SHOT_K) -> str:
+    """The k few-shots closest (cosine) to the question embedding, most similar first."""
+    top = np.argsort(-(_few_shot_vecs() @ vec))[:k]
+    return "\n\n".join(EXAMPLE_BLOCKS[i] for i in top)
 
 # ---------- Retail prompt ----------
 RETAIL_PROMPT = PromptTemplate(
@@ -38,7 +135,7 @@ RETAIL_PROMPT = PromptTemplate(
 You help a store cashier. Convert the question into ONE MySQL SELECT for this database.
 
 Rules:
-- Output ONLY the SQL on a single line. No prose, no labels, no code fences.
+- Output ONLY the SQL on a single line, ending with a semicolon. No prose, no labels, no code fences.
 - Each (brand, color, size) row is a SKU.
 - If they ask "how many / available / in stock", use SUM(`stock_quantity`) (not COUNT(*)).
 - To use discounts, JOIN `t_shirts` t with `discounts` d ON t.`t_shirt_id`=d.`t_shirt_id`.
@@ -64,74 +161,213 @@ ENUMS = {
     "size":  {"XS", "S", "M", "L", "XL"},
 }
 
+# Precompiled once at import; the helpers below run on every question.
+_SIZE_SUBS = [
+    (re.compile(r"\bextra large\b|\bx large\b|\bxl\b", re.I), "XL"),
+    (re.compile(r"\bextra small\b|\bx small\b|\bxs\b", re.I), "XS"),
+    (re.compile(r"\blarge\b", re.I), "L"),
+    (re.compile(r"\bmedium\b", re.I), "M"),
+    (re.compile(r"\bsmall\b", re.I), "S"),
+]
+_VAN_HEUSEN_RE = re.compile(r"\bvan h(?:eu|ue)sen\b", re.I)   # spelling + enum case in one go
+_TEE_RE = re.compile(r"\btee(s)?\b", re.I)
+_TSHIRT_RE = re.compile(r"\btshirt(s)?\b", re.I)
+# Single-word brand/color names → enum case, applied per token ("Van Huesen" is handled above).
+CASE_MAP = {v.lower(): v for v in ENUMS["brand"] | ENUMS["color"] if " " not in v}
+_TOKEN_RE = re.compile(r"\w+|\W+")
+
+_FENCE_RE = re.compile(r"^```(?:sql)?\s*|\s*```$", re.I | re.M)
+_SELECT_RE = re.compile(r"select\s.+", re.I | re.S)
+_STARTS_WITH_SELECT_RE = re.compile(r"select\s", re.I)
+_TRAILING_SEMI_RE = re.compile(r";+\s*$")
+
+# Non-SELECT blocklist: compiled to a Hyperscan DFA when available (true O(n), no backtracking).
+_NON_SELECT_PATTERN = r"\b(?:INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE)\b"
+_NON_SELECT_RE = re.compile(_NON_SELECT_PATTERN, re.I)
+
+def _build_non_select_db():
+    db = hyperscan.Database()
+    db.compile(
+        expressions=[_NON_SELECT_PATTERN.encode()],
+        ids=[0],
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH],
+    )
+    return db
+
+_NON_SELECT_DB = _build_non_select_db() if hyperscan else None
+_NON_SELECT_LOCK = threading.Lock()   # a Database's scratch space is not shareable across threads
+
+def _stop_on_match(*_args) -> bool:
+    return True   # terminate the scan at the first hit
+
+def _has_non_select(sql: str) -> bool:
+    if _NON_SELECT_DB is None:
+        return _NON_SELECT_RE.search(sql) is not None
+    with _NON_SELECT_LOCK:
+        try:
+            _NON_SELECT_DB.scan(sql.encode("utf-8"), match_event_handler=_stop_on_match)
+        except hyperscan.ScanTerminated:
+            return True
+    return False
+
+# One alternation drives the remaining post-cleanup checks (aggregate LIMIT,
+# enum values, COUNT→SUM and discounts JOIN fixups) in a single scan.
+_SQL_LINT = re.compile(
+    r"(?P<count_star>count\s*\(\s*\*\s*\))"
+    r"|(?P<agg>(?:sum|count|avg|min|max)\()"
+    r"|(?P<enum>`(?P<enum_col>brand|color|size)`\s*=\s*'(?P<enum_val>[^']+)')"
+    r"|(?P<price_stock>\b(?:price|stock_quantity)\b)"
+    r"|(?P<pct>\bpct_discount\b)"
+    r"|(?P<from_discounts>from\s+`?discounts`?\b)"
+    r"|(?P<join>join)"
+    r"|(?P<limit>\s+limit\s+\d+\s*$)",
+    re.I,
+)
+
+_STOCK_QUESTION_RE = re.compile(r"\b(how many|available|in stock)\b", re.I)
+_COUNT_STAR_RE = re.compile(r"count\s*\(\s*\*\s*\)", re.I)
+_FROM_DISCOUNTS_RE = re.compile(r"from\s+`?discounts`?\b", re.I)
+_PRICE_COL_RE = re.compile(r"\b`?price`?\b")
+_STOCK_COL_RE = re.compile(r"\b`?stock_quantity`?\b")
+_PCT_COL_RE = re.compile(r"\b`?pct_discount`?\b")
+_SELECT_ID_ONLY_RE = re.compile(r"select\s+`?t_shirt_id`?\s+from", re.I)
+
+
+# Every substitution normalize_retail makes is a whole-word, case-insensitive literal.
+_NORMALIZE_ALIASES = {
+    "extra large": "XL", "x large": "XL", "xl": "XL",
+    "extra small": "XS", "x small": "XS", "xs": "XS",
+    "large": "L", "medium": "M", "small": "S",
+    "van heusen": "Van Huesen",
+    "tee": "t-shirt", "tees": "t-shirt", "tshirt": "t-shirt", "tshirts": "t-shirt",
+    **{v.lower(): v for v in ENUMS["brand"] | ENUMS["color"]},
+}
+
+def _build_automaton():
+    A = ahocorasick.Automaton()
+    for alias, repl in _NORMALIZE_ALIASES.items():
+        A.add_word(alias, (len(alias), repl))
+    A.make_automaton()
+    return A
+
+_NORMALIZE_AUTOMATON = _build_automaton() if ahocorasick else None
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
 def normalize_retail(q: str) -> str:
     """Normalize casual cashier phrasing to match your enum spellings."""
     t = q.strip()
-
+    if _NORMALIZE_AUTOMATON is not None:
+        out = _normalize_single_pass(t)
+        if out is not None:
+            return out
+    return _normalize_regex(t)
+
+def _normalize_single_pass(t: str) -> Optional[str]:
+    """One Aho-Corasick scan; splice leftmost-longest whole-word matches."""
+    low = t.lower()
+    if len(low) != len(t):   # case folding changed offsets (rare Unicode); use regex path
+        return None
+    hits = sorted((end - n + 1, -n, repl) for end, (n, repl) in _NORMALIZE_AUTOMATON.iter(low))
+    out, pos = [], 0
+    for start, neg_n, repl in hits:
+        end = start - neg_n
+        if start < pos:
+            continue
+        if (start > 0 and _is_word_char(low[start - 1])) or (end < len(low) and _is_word_char(low[end])):
+            continue
+        out.append(t[pos:start])
+        out.append(repl)
+        pos = end
+    out.append(t[pos:])
+    return "".join(out)
+
+def _normalize_regex(t: str) -> str:
+    """Fallback when pyahocorasick is not installed: sequential precompiled regexes."""
     # sizes
-    t = re.sub(r"(?i)\bextra large\b|\bx large\b|\bxl\b", "XL", t)
-    t = re.sub(r"(?i)\bextra small\b|\bx small\b|\bxs\b", "XS", t)
-    t = re.sub(r"(?i)\blarge\b", "L", t)
-    t = re.sub(r"(?i)\bmedium\b", "M", t)
-    t = re.sub(r"(?i)\bsmall\b", "S", t)
+    for pat, repl in _SIZE_SUBS:
+        t = pat.sub(repl, t)
 
     # brand spelling (your ENUM uses "Van Huesen")
-    t = re.sub(r"(?i)\bvan heusen\b", "Van Huesen", t)
+    t = _VAN_HEUSEN_RE.sub("Van Huesen", t)
 
     # normalize product slang
-    t = re.sub(r"(?i)\btee(s)?\b", "t-shirt", t)
-    t = re.sub(r"(?i)\btshirt(s)?\b", "t-shirt", t)
+    t = _TEE_RE.sub("t-shirt", t)
+    t = _TSHIRT_RE.sub("t-shirt", t)
 
     # case-correct brand & color names to enum case
-    for b in ENUMS["brand"]:
-        t = re.sub(rf"(?i)\b{re.escape(b)}\b", b, t)
-    for c in ENUMS["color"]:
-        t = re.sub(rf"(?i)\b{re.escape(c)}\b", c, t)
-
-    return t
+    return "".join(CASE_MAP.get(tok.lower(), tok) for tok in _TOKEN_RE.findall(t))
 
 def _clean_sql(text: str) -> str:
-    """Strip code fences; keep first SELECT; collapse whitespace; block non-SELECT; strip LIMIT for aggregates."""
-    text = re.sub(r"^```(?:sql)?\s*|\s*```$", "", text.strip(), flags=re.I | re.M)
-    m = re.search(r"select\s.+", text, flags=re.I | re.S)
+    """Strip code fences; keep first SELECT; collapse whitespace; drop trailing semicolons."""
+    text = _FENCE_RE.sub("", text.strip())
+    m = _SELECT_RE.search(text)
     sql = m.group(0) if m else text
     sql = " ".join(sql.split())
-    sql = re.sub(r";+\s*$", "", sql)
+    return _TRAILING_SEMI_RE.sub("", sql)
+
+def _lint_sql(sql: str) -> Dict[str, Any]:
+    """Single _SQL_LINT pass → findings used by validate_sql / _fixup_sql / enforce_enum."""
+    f: Dict[str, Any] = {
+        "count_star": False, "agg": False, "price_stock": False, "pct": False,
+        "from_discounts": -1, "join": -1, "limit": -1, "enum": [],
+    }
+    for m in _SQL_LINT.finditer(sql):
+        kind = m.lastgroup
+        if kind == "enum":
+            f["enum"].append((m.group("enum_col").lower(), m.group("enum_val")))
+        elif kind in ("from_discounts", "join", "limit"):
+            f[kind] = m.start()   # last occurrence wins
+        else:
+            f[kind] = True
+    f["agg"] = f["agg"] or f["count_star"]
+    return f
+
+@functools.lru_cache(maxsize=1024)
+def validate_sql(question: str, raw: str) -> str:
+    """Raw LLM text → cleaned SELECT: block non-SELECT, strip LIMIT for aggregates, enum check, fixups."""
+    sql = _clean_sql(raw)
+
+    # empty / prose replies ("Sorry, I can't ...") come through _clean_sql unchanged
+    if not _STARTS_WITH_SELECT_RE.match(sql):
+        raise ValueError(f"No SELECT generated: {sql!r}")
 
     # block non-SELECT
-    if re.search(r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE)\b", sql, flags=re.I):
+    if _has_non_select(sql):
         raise ValueError(f"Non-SELECT generated: {sql}")
 
+    lint = _lint_sql(sql)
+
     # strip LIMIT on aggregates
-    low = sql.lower()
-    if any(fn in low for fn in ("sum(", "count(", "avg(", "min(", "max(")) and " limit " in low:
-        sql = re.sub(r"\s+limit\s+\d+\s*$", "", sql, flags=re.I)
-    return sql
+    if lint["agg"] and lint["limit"] >= 0:
+        sql = sql[:lint["limit"]]
+
+    enforce_enum(sql, lint)
+    return _fixup_sql(question, sql, lint)
 
-def _fixup_sql(question: str, sql: str) -> str:
+def _fixup_sql(question: str, sql: str, lint: Dict[str, Any]) -> str:
     """Auto-correct common mistakes (COUNT→SUM for stock; ensure JOIN for discount math)."""
     s = sql
+    refs_price_or_stock = lint["price_stock"]
 
     # Prefer SUM(stock_quantity) when asking how many/available/in stock
-    if re.search(r"(?i)\b(how many|available|in stock)\b", question) and re.search(r"count\s*\(\s*\*\s*\)", s, re.I):
-        s = re.sub(r"count\s*\(\s*\*\s*\)", "SUM(`stock_quantity`)", s, flags=re.I)
+    if lint["count_star"] and _STOCK_QUESTION_RE.search(question):
+        s = _COUNT_STAR_RE.sub("SUM(`stock_quantity`)", s)
+        refs_price_or_stock = True
 
     # If referencing price/stock/discount from discounts-only query, promote to JOIN
-    refs_price_or_stock = re.search(r"\b(price|stock_quantity)\b", s, re.I)
-    refs_discount = re.search(r"\bpct_discount\b", s, re.I)
-    from_only_discounts = re.search(r"from\s+`?discounts`?\b(?!.*join)", s, re.I)
-    if (refs_price_or_stock or refs_discount) and from_only_discounts:
-        s = re.sub(
-            r"from\s+`?discounts`?\b",
-            "FROM `t_shirts` t INNER JOIN `discounts` d ON t.`t_shirt_id`=d.`t_shirt_id`",
-            s, flags=re.I
+    from_only_discounts = lint["from_discounts"] > lint["join"]
+    if (refs_price_or_stock or lint["pct"]) and from_only_discounts:
+        s = _FROM_DISCOUNTS_RE.sub(
+            "FROM `t_shirts` t INNER JOIN `discounts` d ON t.`t_shirt_id`=d.`t_shirt_id`", s
         )
-        s = re.sub(r"\b`?price`?\b", "t.`price`", s)
-        s = re.sub(r"\b`?stock_quantity`?\b", "t.`stock_quantity`", s)
-        s = re.sub(r"\b`?pct_discount`?\b", "d.`pct_discount`", s)
+        s = _PRICE_COL_RE.sub("t.`price`", s)
+        s = _STOCK_COL_RE.sub("t.`stock_quantity`", s)
+        s = _PCT_COL_RE.sub("d.`pct_discount`", s)
 
         # if it was selecting only t_shirt_id, rewrite to meaningful top-1 by revenue
-        if re.search(r"select\s+`?t_shirt_id`?\s+from", s, re.I):
+        if _SELECT_ID_ONLY_RE.search(s):
             s = (
                 "SELECT t.`brand`, t.`color`, t.`size`, "
                 "t.`price`, t.`stock_quantity`, d.`pct_discount`, "
@@ -141,56 +377,120 @@ def _fixup_sql(question: str, sql: str) -> str:
             )
     return s
 
-def enforce_enum(sql: str) -> str:
+def enforce_enum(sql: str, lint: Optional[Dict[str, Any]] = None) -> str:
     """Ensure any WHERE brand/color/size='...' values are inside allowed enums."""
-    issues = []
-    for col, allowed in ENUMS.items():
-        for m in re.finditer(rf"`{col}`\s*=\s*'([^']+)'", sql, flags=re.I):
-            val = m.group(1)
-            if val not in allowed:
-                issues.append((col, val))
+    found = (lint or _lint_sql(sql))["enum"]
+    issues = [(col, val) for c in ENUMS for col, val in found if col == c and val not in ENUMS[col]]
     if issues:
         raise ValueError(f"Out-of-enum value(s): {issues}")
     return sql
 
+# A semantic hit must agree on everything that changes the SQL, not just "look similar":
+# "Nike White L" vs "Nike White M", "stock by color" vs "stock by size",
+# "cheapest" vs "most expensive" all embed close together but need different queries.
+# Case-insensitive: normalize_retail leaves bare size letters ("white m tees") lowercase.
+# (?<!') keeps possessives like "Nike's" from reading as size S.
+_EXACT_TERMS_RE = re.compile(
+    r"(?<!')\b(?:"
+    + "|".join(re.escape(v) for v in sorted(set().union(*ENUMS.values()), key=len, reverse=True))
+    + r"|\d+(?:\.\d+)?)\b",
+    re.I,
+)
+_ENUM_CASE = {v.lower(): v for v in set().union(*ENUMS.values())}
+_WORD_RE = re.compile(r"\w+")
+
+# word → intent tags (columns, aggregates, ordering, grouping, comparison, negation)
+_INTENT_WORDS: Dict[str, Tuple[str, ...]] = {}
+for _tags, _words in [
+    (("color",), "color colour colors colours"),
+    (("size",), "size sizes"),
+    (("brand",), "brand brands"),
+    (("price",), "price prices priced cost costs costly expensive pricey"),
+    (("price", "min"), "cheapest"),
+    (("price", "max"), "priciest"),
+    (("price", "lt"), "cheap cheaper"),
+    (("price", "gt"), "pricier"),
+    (("stock",), "stock stocks inventory available availability quantity quantities many units left"),
+    (("discount",), "discount discounts discounted sale offer offers"),
+    (("revenue",), "revenue value worth sales"),
+    (("min",), "lowest least min minimum fewest"),
+    (("max",), "most highest max maximum top largest biggest"),
+    (("avg",), "avg average mean"),
+    (("sum",), "total sum overall"),
+    (("count",), "count number skus"),
+    (("group",), "by per each breakdown"),
+    (("not",), "not no without except excluding"),
+    (("lt",), "under below less fewer lower"),
+    (("gt",), "over above more greater higher"),
+]:
+    for _w in _words.split():
+        _INTENT_WORDS[_w] = _tags
+
+def _exact_terms(normalized: str) -> List[str]:
+    """Enum values, numbers and intent tags that must match exactly for a semantic hit."""
+    terms = {_ENUM_CASE.get(t.lower(), t) for t in _EXACT_TERMS_RE.findall(normalized)}
+    for w in _WORD_RE.findall(normalized.lower()):
+        terms.update(_INTENT_WORDS.get(w, ()))
+    return sorted(terms)
+
 def generate_sql(question: str) -> str:
-    """Build prompt (few-shots + live schema + rules) → LLM → cleaned SQL."""
-    schema = db.get_table_info()
-    raw = LLMChain(llm=llm, prompt=RETAIL_PROMPT).run(
-        {"question": question, "schema": schema, "examples": EXAMPLES}
-    ).strip()
-    sql = _clean_sql(raw)
-    sql = _fixup_sql(question, sql)
-    sql = enforce_enum(sql)
+    """Normalized question → SQL, via exact-match LRU → semantic cache → LLM."""
+    return _generate_sql(question, _schema_version())
+
+def _schema_version() -> str:
+    return hashlib.md5(get_schema().encode("utf-8")).hexdigest()
+
+@functools.lru_cache(maxsize=512)
+def _generate_sql(question: str, schema_version: str) -> str:
+    """Exact-match layer; keyed on the schema version so DDL changes invalidate it."""
+    cache = get_semantic_cache()
+    vec = embed([question])[0]
+    terms = _exact_terms(question)
+    for row_id, hit in cache.lookup(vec):
+        if hit.get("schema_version") != schema_version:
+            cache.discard(row_id)   # SQL for an old schema; would otherwise shadow its replacement
+        elif _exact_terms(hit["normalized"]) == terms:
+            cache.touch(row_id)
+            return hit["sql"]
+
+    sql = _llm_sql(question, vec, schema_version)
+    run_sql(sql)   # cache only SQL that executes; ask_retail's run_sql is then a TTL hit
+    cache.add(question, vec, {"normalized": question, "sql": sql, "schema_version": schema_version})
     return sql
 
-def run_sql(sql: str) -> Union[str, List[Tuple], Tuple]:
-    """Execute SQL and return rows (string or list of tuples depending on backend)."""
-    return db.run(sql)
-
-def _to_scalar(rows: Union[str, List[Tuple], Tuple]) -> Optional[Union[int, float]]:
+@functools.lru_cache(maxsize=4)
+def _base_prompt(schema_version: str) -> str:
+    """RETAIL_PROMPT with rules + schema baked in once per schema version."""
+    return RETAIL_PROMPT.template.replace("{schema}", get_schema())
+
+def _llm_sql(question: str, vec: np.ndarray, schema_version: str) -> str:
+    """Build prompt (nearest few-shots + minified schema + rules) → LLM → cleaned SQL."""
+    prompt = (_base_prompt(schema_version)
+              .replace("{examples}", select_examples(vec))
+              .replace("{question}", question))
+    raw = get_llm()._call(prompt).strip()   # skip LangChain callback/run-manager setup
+    return validate_sql(question, raw)
+
+# Short TTL: absorbs rapid re-asks without serving stale stock figures.
+@cached(TTLCache(maxsize=256, ttl=30), lock=threading.Lock())
+def run_sql(sql: str) -> List[Tuple]:
+    """Execute SQL on the pooled engine and return real row tuples (Decimal etc. preserved)."""
+    with get_sql_engine().connect() as conn:
+        return [tuple(r) for r in conn.execute(text(sql))]
+
+def _to_scalar(rows: List[Tuple]) -> Optional[Union[int, float]]:
     """Return a scalar if it's a 1x1 aggregate; otherwise None."""
-    py = rows
-    if isinstance(rows, str):
-        try:
-            py = ast.literal_eval(rows)
-        except Exception:
-            py = rows
-
-    if isinstance(py, (list, tuple)) and py and isinstance(py[0], (list, tuple)) and len(py[0]) == 1:
-        v = py[0][0]
-        if isinstance(v, Decimal):
-            return int(v) if v == v.to_integral_value() else float(v)
-        if isinstance(v, (int, float)):
-            return int(v) if float(v).is_integer() else float(v)
-        m = re.search(r"[-+]?\d*\.?\d+", str(v))
-        if m:
-            return float(m.group()) if "." in m.group() else int(m.group())
-    if isinstance(rows, str):
-        m = re.search(r"[-+]?\d*\.?\d+", rows)
-        if m:
-            return float(m.group()) if "." in m.group() else int(m.group())
-    return None
+    if not rows or len(rows[0]) != 1:
+        return None
+    v = rows[0][0]
+    if isinstance(v, Decimal):
+        return int(v) if v == v.to_integral_value() else float(v)
+    if isinstance(v, (int, float)):
+        return int(v) if float(v).is_integer() else float(v)
+    if v is None:
+        return None
+    # numeric text in a VARCHAR column
+    return first_number(str(v))
 
 def _is_groupby(sql: str) -> bool:
     return " group by " in sql.lower()
@@ -202,7 +502,7 @@ def ask_retail(user_text: str) -> Dict[str, Any]:
     rows = run_sql(sql)
 
     # Empty or no match
-    if rows in ("", []) or (isinstance(rows, list) and len(rows) == 0):
+    if not rows:
         return {
             "question": user_text,
             "normalized": normalized,
@@ -3,11 +3,39 @@ from langchain_core.language_models import LLM
 import google.generativeai as genai
 from typing import List, Optional
 import os
+import re
+
+# Stop reading once the statement is provably complete: an unfenced line ending in ";".
+# Anything else (multi-line SQL, fenced replies) streams to the end of the reply / token cap.
+_SELECT_RE = re.compile(r"select\s", re.I)
+
+def _chunk_text(chunk, buf: str) -> str:
+    """Text of one stream chunk; `buf` is the text streamed so far."""
+    try:
+        return chunk.text
+    except ValueError:
+        # Only a trailing finish_reason chunk without parts is harmless. A blocked prompt or a
+        # reply stopped (e.g. SAFETY) before any text raises, as response.text did unstreamed.
+        if buf and chunk.candidates and not chunk.candidates[0].content.parts:
+            return ""
+        raise
+
+def _sql_line_end(buf: str) -> int:
+    """Index of the newline ending the SQL statement (line ends with ';'), or -1 to keep reading."""
+    m = _SELECT_RE.search(buf)
+    if not m or buf.count("```", 0, m.start()) % 2:   # no SELECT yet, or inside a code fence
+        return -1
+    nl = buf.find("\n", m.start())
+    while nl != -1:
+        if buf[m.start():nl].rstrip().endswith(";"):
+            return nl
+        nl = buf.find("\n", nl + 1)
+    return -1
 
 class GeminiLLM(LLM):
     model: str = "models/gemini-1.5-flash"
     temperature: float = 0.2
-    max_output_tokens: int = 512
+    max_output_tokens: int = 160   # ample for one SELECT
 
     def __init__(self, **kwargs):
         super().__init__()
@@ -17,9 +45,26 @@ class GeminiLLM(LLM):
         genai.configure(api_key=api_key)
         self._model = genai.GenerativeModel(self.model)
 
+    def _generation_config(self, stop: Optional[List[str]] = None) -> genai.GenerationConfig:
+        return genai.GenerationConfig(
+            temperature=self.temperature,
+            max_output_tokens=self.max_output_tokens,
+            stop_sequences=stop,   # no "\n\n" default: it empties a reply that opens with a blank line
+        )
+
     def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        response = self._model.generate_content(prompt)
-        return response.text
+        buf = ""
+        stream = self._model.generate_content(
+            prompt, generation_config=self._generation_config(stop), stream=True
+        )
+        for chunk in stream:
+            buf += _chunk_text(chunk, buf)
+            end = _sql_line_end(buf)
+            if end != -1:
+                return buf[:end]
+        if not buf.strip():
+            raise ValueError("Gemini returned no text.")
+        return buf
 
     @property
     def _llm_type(self) -> str:
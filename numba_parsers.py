@@ -0,0 +1,49 @@
+# numba_parsers.py
+# Fast path for pulling the first number out of a DB cell / result string.
+# Same semantics as re.search(r"[-+]?\d*\.?\d+", text); Numba is optional.
+
+import re
+from typing import Optional, Tuple, Union
+
+try:
+    from numba import njit
+except ImportError:  # optional: fall back to the regex below
+    njit = None
+
+_NUMBER_RE = re.compile(r"[-+]?\d*\.?\d+")
+
+if njit is not None:
+    @njit(cache=True)
+    def _first_number_span(buf: bytes) -> Tuple[int, int, bool]:
+        """(start, end, is_float) of the first number in an ASCII buffer; (-1, -1, False) if none."""
+        n = len(buf)
+        for i in range(n):
+            j = i
+            if buf[j] == 43 or buf[j] == 45:          # '+' / '-'
+                j += 1
+            k = j
+            while k < n and 48 <= buf[k] <= 57:       # integer digits
+                k += 1
+            if k + 1 < n and buf[k] == 46 and 48 <= buf[k + 1] <= 57:   # '.' then a digit
+                k += 1
+                while k < n and 48 <= buf[k] <= 57:
+                    k += 1
+                return i, k, True
+            if k > j:
+                return i, k, False
+        return -1, -1, False
+
+    _first_number_span(b"0")   # warm up: compile (or load from cache) at import, not on first question
+
+def first_number(text: str) -> Optional[Union[int, float]]:
+    """First number in `text` as int/float, or None."""
+    if njit is not None and text.isascii():
+        start, end, is_float = _first_number_span(text.encode("ascii"))
+        if start < 0:
+            return None
+        s = text[start:end]
+        return float(s) if is_float else int(s)
+    m = _NUMBER_RE.search(text)
+    if not m:
+        return None
+    return float(m.group()) if "." in m.group() else int(m.group())
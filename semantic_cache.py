@@ -0,0 +1,279 @@
+# semantic_cache.py
+# Semantic cache in front of the LLM: near-duplicate questions reuse previously generated SQL.
+# Uses: sentence-transformers (all-MiniLM-L6-v2) + FAISS inner-product index.
+# Entries live in SQLite; the FAISS index is snapshotted to disk so startup doesn't rebuild it.
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+import streamlit as st
+from sentence_transformers import SentenceTransformer
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+except ImportError:  # optional: embed with the FP32 sentence-transformers model
+    ORTModelForFeatureExtraction = None
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+INT8_MODEL_DIR = os.getenv("EMBED_INT8_DIR", "miniLM-int8")
+CACHE_DB = os.getenv("SEMANTIC_CACHE_DB", "cache.sqlite")
+CACHE_INDEX = os.getenv("SEMANTIC_CACHE_INDEX", "cache.faiss")
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "50000"))
+SAVE_EVERY = 20               # snapshot the index every N adds, not on every call
+SIMILARITY_THRESHOLD = 0.87   # cosine on L2-normalized vectors
+LOOKUP_K = 5                  # candidates per lookup, so a rejected nearest entry can't shadow a valid one
+HNSW_MIN_ENTRIES = 1000       # below this a flat scan is cheaper than graph traversal
+HNSW_M = 32
+
+def embedder_id() -> str:
+    """Which model/precision produces the vectors; cached vectors from another embedder are unusable."""
+    return f"{EMBED_MODEL}:{'onnx-int8' if ORTModelForFeatureExtraction is not None else 'fp32'}"
+
+def _int8_ready(save_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(save_dir, f))
+               for f in ("model_quantized.onnx", "tokenizer_config.json"))
+
+def export_int8(save_dir: str = INT8_MODEL_DIR) -> None:
+    """Export + int8-quantize MiniLM into save_dir; built in a temp dir and renamed into place.
+
+    Takes tens of seconds, so run it as a setup step (`python semantic_cache.py`)
+    rather than letting the first question pay for it.
+    """
+    if _int8_ready(save_dir):
+        return
+    if os.path.isdir(save_dir):   # left behind by an interrupted non-atomic export
+        shutil.rmtree(save_dir)
+    tmp = tempfile.mkdtemp(prefix=".miniLM-int8-", dir=os.path.dirname(os.path.abspath(save_dir)))
+    try:
+        fp32 = ORTModelForFeatureExtraction.from_pretrained(EMBED_MODEL, export=True)
+        ORTQuantizer.from_pretrained(fp32).quantize(
+            save_dir=tmp,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+        )
+        AutoTokenizer.from_pretrained(EMBED_MODEL).save_pretrained(tmp)
+        try:
+            os.replace(tmp, save_dir)   # save_dir is either absent or complete
+        except OSError:
+            if not _int8_ready(save_dir):   # only a lost race with another worker is fine
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+class Int8Embedder:
+    """MiniLM exported to ONNX and dynamically int8-quantized (AVX512-VNNI); mean-pooled like sentence-transformers."""
+
+    def __init__(self, save_dir: str = INT8_MODEL_DIR):
+        export_int8(save_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(save_dir, file_name="model_quantized.onnx")
+        self.tokenizer = AutoTokenizer.from_pretrained(save_dir)
+
+    def encode(self, texts: List[str], convert_to_numpy: bool = True,
+               normalize_embeddings: bool = True) -> np.ndarray:
+        enc = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
+        hidden = self.model(**enc).last_hidden_state
+        mask = enc["attention_mask"][..., None].astype(hidden.dtype)
+        vecs = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize_embeddings:
+            vecs = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs
+
+@st.cache_resource
+def get_embedder():
+    """Load MiniLM once per server process: int8 ONNX if optimum is installed, else FP32."""
+    if ORTModelForFeatureExtraction is not None:
+        return Int8Embedder()
+    return SentenceTransformer(EMBED_MODEL)
+
+def embed(texts: List[str]) -> np.ndarray:
+    """Embed texts → float32 matrix of L2-normalized rows (cosine == inner product)."""
+    vecs = get_embedder().encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    return np.ascontiguousarray(vecs, dtype="float32")
+
+def make_index(dim: int, n: int) -> faiss.Index:
+    """Exact IndexFlatIP for small caches; HNSW (inner product, O(log N) search) once large."""
+    if n < HNSW_MIN_ENTRIES:
+        return faiss.IndexFlatIP(dim)
+    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 64
+    index.hnsw.efSearch = 32
+    return index
+
+class SemanticCache:
+    """FAISS index over past normalized questions; entries live in SQLite, LRU-evicted by `ts`."""
+
+    def __init__(self, path: str = CACHE_DB, index_path: str = CACHE_INDEX,
+                 threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES,
+                 embedder: Optional[str] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " normalized_q TEXT NOT NULL,"
+            " embedding BLOB NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " ts REAL NOT NULL)"   # last access (insert or served hit)
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._check_embedder(embedder or embedder_id())
+        self._conn.commit()
+        self._index: Optional[faiss.Index] = None
+        self._ids: List[int] = []   # FAISS position → SQLite row id
+        self._dead: Set[int] = set()   # discarded row ids whose vectors stay in FAISS until a rebuild
+        self._unsaved = 0
+        self._load()
+
+    def _check_embedder(self, embedder: str) -> None:
+        """Drop all entries if they were embedded by a different model/precision (e.g. optimum added)."""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+        if row and row[0] != embedder:
+            self._conn.execute("DELETE FROM entries")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (embedder,))
+
+    def _load(self) -> None:
+        """Warm start from the index snapshot; only re-add rows it doesn't cover."""
+        ids = [r[0] for r in self._conn.execute("SELECT id FROM entries ORDER BY id")]
+        snap_ids = self._read_snapshot()
+        if snap_ids is None or snap_ids != ids[:len(snap_ids)]:
+            self._rebuild()
+            return
+        self._ids = snap_ids
+        tail = ids[len(snap_ids):]
+        if tail:   # added after the last snapshot
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM entries WHERE id >= ? ORDER BY id", (tail[0],)
+            ).fetchall()
+            self._append(np.vstack([np.frombuffer(r[1], dtype="float32") for r in rows]), [r[0] for r in rows])
+            self._save()
+
+    def _read_snapshot(self) -> Optional[List[int]]:
+        try:
+            index = faiss.read_index(self.index_path)
+            ids = np.load(self.index_path + ".ids.npy").tolist()
+        except (RuntimeError, OSError, ValueError):
+            return None
+        if index.ntotal != len(ids):
+            return None
+        self._index = index
+        return ids
+
+    def _rebuild(self) -> None:
+        """Re-create the index from the embeddings stored in SQLite (startup mismatch, eviction)."""
+        rows = self._conn.execute("SELECT id, embedding FROM entries ORDER BY id").fetchall()
+        self._ids = [r[0] for r in rows]
+        self._dead = set()
+        self._index = None
+        if rows:
+            vecs = np.vstack([np.frombuffer(r[1], dtype="float32") for r in rows])
+            self._index = make_index(vecs.shape[1], len(vecs))
+            self._index.add(vecs)
+        self._save()
+
+    def _save(self) -> None:
+        """Snapshot index + position→id map (write-then-rename so readers never see a partial file)."""
+        if self._index is None:
+            for path in (self.index_path, self.index_path + ".ids.npy"):
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            faiss.write_index(self._index, self.index_path + ".tmp")
+            os.replace(self.index_path + ".tmp", self.index_path)
+            with open(self.index_path + ".ids.tmp", "wb") as f:
+                np.save(f, np.asarray(self._ids, dtype="int64"))
+            os.replace(self.index_path + ".ids.tmp", self.index_path + ".ids.npy")
+        self._unsaved = 0
+
+    def lookup(self, vec: np.ndarray, k: int = LOOKUP_K) -> List[Tuple[int, Dict[str, Any]]]:
+        """(row id, payload) of up to k past questions with cosine ≥ threshold, nearest first."""
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return []
+            n = min(k + len(self._dead), self._index.ntotal)
+            scores, pos = self._index.search(vec.reshape(1, -1), n)
+            hits = []
+            for score, p in zip(scores[0], pos[0]):
+                if p < 0 or score < self.threshold or self._ids[p] in self._dead:
+                    continue
+                row = self._conn.execute("SELECT payload FROM entries WHERE id = ?", (self._ids[p],)).fetchone()
+                if row:
+                    hits.append((self._ids[p], json.loads(row[0])))
+        return hits[:k]
+
+    def touch(self, row_id: int) -> None:
+        """Mark an entry as used (LRU). Only call for hits the caller actually served."""
+        with self._lock:
+            self._conn.execute("UPDATE entries SET ts = ? WHERE id = ?", (time.time(), row_id))
+            self._conn.commit()
+
+    def discard(self, row_id: int) -> None:
+        """Delete an entry that can never be served again (e.g. generated for an old schema)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE id = ?", (row_id,))
+            self._conn.commit()
+            self._dead.add(row_id)
+
+    def add(self, normalized: str, vec: np.ndarray, payload: Dict[str, Any]) -> None:
+        """Store a payload (generated SQL etc.) under its question embedding."""
+        vec = np.ascontiguousarray(vec.reshape(1, -1), dtype="float32")
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO entries (normalized_q, embedding, payload, ts) VALUES (?, ?, ?, ?)",
+                (normalized, vec.tobytes(), json.dumps(payload), time.time()),
+            )
+            self._conn.commit()
+            self._append(vec, [cur.lastrowid])
+            if len(self._ids) - len(self._dead) > self.max_entries:
+                self._evict()
+            elif self._unsaved >= SAVE_EVERY:
+                self._save()
+
+    def _append(self, vecs: np.ndarray, ids: List[int]) -> None:
+        if self._index is None:
+            self._index = make_index(vecs.shape[1], len(vecs))
+        self._index.add(vecs)
+        self._ids.extend(ids)
+        self._unsaved += len(ids)
+        if isinstance(self._index, faiss.IndexFlatIP) and self._index.ntotal >= HNSW_MIN_ENTRIES:
+            self._promote()
+
+    def _evict(self) -> None:
+        """Drop the least recently used 10% down from the cap, then rebuild (HNSW can't remove)."""
+        keep = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM entries WHERE id IN (SELECT id FROM entries ORDER BY ts LIMIT ?)",
+            (len(self._ids) - len(self._dead) - keep,),
+        )
+        self._conn.commit()
+        self._rebuild()
+
+    def _promote(self) -> None:
+        """Rebuild the flat index as HNSW (same positions, so _ids stays valid)."""
+        vecs = self._index.reconstruct_n(0, self._index.ntotal)
+        index = make_index(vecs.shape[1], len(vecs))
+        index.add(vecs)
+        self._index = index
+
+@st.cache_resource
+def get_semantic_cache() -> SemanticCache:
+    """One cache per server process, shared by all sessions; warmed from disk on startup."""
+    return SemanticCache()
+
+if __name__ == "__main__":
+    # Setup step: build the int8 model ahead of time instead of inside the first request.
+    if ORTModelForFeatureExtraction is None:
+        raise SystemExit("optimum[onnxruntime] is not installed; the FP32 model needs no setup.")
+    export_int8()
+    print(f"int8 MiniLM ready in {INT8_MODEL_DIR}/")
@@ -0,0 +1,29 @@
+# tests/conftest.py
+# Make the top-level modules importable and give engine.py the env it checks at import.
+# Nothing connects at import time: the DB engine, LLM and embedder are created lazily.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import pytest
+
+
+@pytest.fixture
+def semantic_cache(tmp_path, monkeypatch):
+    """(cache, vec): an empty on-disk SemanticCache wired into engine, which embeds every question as `vec`."""
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    import engine
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(str(tmp_path / "c.sqlite"), str(tmp_path / "c.faiss"))
+    vec = np.zeros(8, dtype="float32")
+    vec[0] = 1.0
+    monkeypatch.setattr(engine, "get_semantic_cache", lambda: cache)
+    monkeypatch.setattr(engine, "embed", lambda texts: vec.reshape(1, -1))
+    engine._generate_sql.cache_clear()
+    return cache, vec
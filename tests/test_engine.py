@@ -0,0 +1,104 @@
+# tests/test_engine.py
+import pytest
+
+for mod in ("streamlit", "cachetools", "dotenv", "sqlalchemy", "langchain", "google.generativeai",
+            "faiss", "sentence_transformers"):
+    pytest.importorskip(mod)
+
+import engine
+
+
+def terms(q):
+    return engine._exact_terms(engine.normalize_retail(q))
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Stock by color for Nike", "Stock by size for Nike"),
+    ("cheapest Nike t-shirt", "most expensive Nike t-shirt"),
+    ("price of Nike White L", "stock of Nike White L"),
+    ("how many nike white large tees", "how many nike white medium tees"),
+    ("how many nike white m tees", "how many nike white l tees"),
+    ("price of levi black s", "price of levi black xs"),
+    ("Nike t-shirts under 500", "Nike t-shirts over 500"),
+    ("average price for Levi", "total price for Levi"),
+    ("Nike stock", "Nike stock without discount"),
+])
+def test_semantic_hit_guard_rejects_different_intent(a, b):
+    assert terms(a) != terms(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("how many nike white large tees", "How many Nike White L t-shirts?"),
+    ("Stock by color for Nike", "nike stock by colour"),
+    ("price of van heusen black xl", "Van Huesen Black extra large price"),
+    ("how many nike white m tees", "How many Nike White M t-shirts?"),
+    ("Nike's white stock", "nike white stock"),
+])
+def test_semantic_hit_guard_accepts_paraphrase(a, b):
+    assert terms(a) == terms(b)
+
+
+def test_schema_change_replaces_stale_semantic_entry(semantic_cache, monkeypatch):
+    cache, vec = semantic_cache
+    calls = []
+    monkeypatch.setattr(engine, "_llm_sql", lambda q, v, version: calls.append(version) or f"SQL-{version}")
+    monkeypatch.setattr(engine, "run_sql", lambda sql: [])
+
+    q = engine.normalize_retail("how many nike white large tees")
+    assert engine._generate_sql(q, "v1") == "SQL-v1"
+    for _ in range(3):
+        engine._generate_sql.cache_clear()
+        assert engine._generate_sql(q, "v2") == "SQL-v2"
+    assert calls == ["v1", "v2"]
+    assert [hit["sql"] for _, hit in cache.lookup(vec)] == ["SQL-v2"]
+
+
+def test_rejected_semantic_candidate_is_not_refreshed(semantic_cache, monkeypatch):
+    cache, vec = semantic_cache
+    by_color = engine.normalize_retail("Stock by color for Nike")
+    cache.add(by_color, vec, {"normalized": by_color, "sql": "BY-COLOR", "schema_version": "v1"})
+    ts_of = lambda: cache._conn.execute("SELECT ts FROM entries").fetchone()[0]
+    before = ts_of()
+    monkeypatch.setattr(engine, "_llm_sql", lambda q, v, version: "BY-SIZE")
+    monkeypatch.setattr(engine, "run_sql", lambda sql: [])
+
+    assert engine._generate_sql(engine.normalize_retail("Stock by size for Nike"), "v1") == "BY-SIZE"
+    assert ts_of() == before
+
+
+@pytest.mark.parametrize("raw", ["", "Sorry, I can't answer that."])
+def test_validate_sql_rejects_reply_without_select(raw):
+    with pytest.raises(ValueError):
+        engine.validate_sql("how many Nike t-shirt", raw)
+
+
+def test_sql_that_fails_to_run_is_not_cached(semantic_cache, monkeypatch):
+    from sqlalchemy.exc import DBAPIError
+
+    cache, vec = semantic_cache
+    calls = []
+    monkeypatch.setattr(engine, "_llm_sql", lambda q, v, version: calls.append(q) or "SELECT `nope` FROM `missing`")
+
+    q = engine.normalize_retail("how many nike white large tees")
+    for _ in range(2):
+        with pytest.raises(DBAPIError):
+            engine._generate_sql(q, "v1")
+    assert len(calls) == 2
+    assert cache.lookup(vec) == []
+
+
+def test_semantic_cache_dropped_when_embedder_changes(semantic_cache, tmp_path):
+    from semantic_cache import SemanticCache
+
+    cache, vec = semantic_cache
+    db, idx = str(tmp_path / "c.sqlite"), str(tmp_path / "c.faiss")
+    cache.add("q", vec, {"normalized": "q", "sql": "SQL", "schema_version": "v1"})
+    cache._save()
+
+    assert [hit["sql"] for _, hit in SemanticCache(db, idx).lookup(vec)] == ["SQL"]
+    assert SemanticCache(db, idx, embedder="other-model:onnx-int8").lookup(vec) == []
+
+
+def test_few_shot_sql_ends_with_the_semicolon_the_prompt_asks_for():
+    assert all(block.endswith(";") for block in engine.EXAMPLE_BLOCKS)
+    assert engine._clean_sql(engine.EXAMPLE_BLOCKS[0].split("SQL: ", 1)[1]).endswith("'L'")
@@ -0,0 +1,57 @@
+# tests/test_gemini_llm.py
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("google.generativeai")
+
+from gemini_llm import _chunk_text, _sql_line_end
+
+
+def test_single_line_statement_stops_at_its_newline():
+    buf = "SELECT SUM(`stock_quantity`) FROM `t_shirts`;\nextra"
+    assert buf[:_sql_line_end(buf)] == "SELECT SUM(`stock_quantity`) FROM `t_shirts`;"
+
+
+@pytest.mark.parametrize("buf", [
+    "SELECT SUM(`stock_quantity`) FROM `t_shirts`\n",                      # multi-line, WHERE still coming
+    "SELECT SUM(`stock_quantity`) FROM `t_shirts`\nWHERE `brand`='Nike'",
+    "```sql\nSELECT 1;\n",                                                 # inside an open fence
+    "here you go",
+])
+def test_keeps_reading_until_statement_is_complete(buf):
+    assert _sql_line_end(buf) == -1
+
+
+def test_multi_line_statement_stops_after_semicolon():
+    buf = "SELECT SUM(`stock_quantity`) FROM `t_shirts`\nWHERE `brand`='Nike';\n"
+    assert buf[:_sql_line_end(buf)].endswith("WHERE `brand`='Nike';")
+
+
+
+class _Chunk:
+    def __init__(self, text=None, candidates=()):
+        self._text, self.candidates = text, list(candidates)
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("no parts")
+        return self._text
+
+
+_NO_PARTS = SimpleNamespace(content=SimpleNamespace(parts=[]))
+
+
+def test_trailing_chunk_without_parts_is_empty():
+    assert _chunk_text(_Chunk(candidates=[_NO_PARTS]), "SELECT 1;") == ""
+
+
+@pytest.mark.parametrize("chunk", [
+    _Chunk(candidates=[_NO_PARTS]),   # stopped (e.g. SAFETY) before any text
+    _Chunk(),                         # blocked prompt: no candidates at all
+])
+def test_chunk_without_text_before_any_output_raises(chunk):
+    with pytest.raises(ValueError):
+        _chunk_text(chunk, "")